@@ -36,6 +36,9 @@ CAMERA_CAPTURE_HEIGHT = 480
 # Kích thước khung hình cuối cùng sau khi xoay (cho hợp với màn hình dọc)
 FINAL_FRAME_WIDTH = 480
 FINAL_FRAME_HEIGHT = 640
+# Số bảng remap (xoay + zoom) được giữ trong cache cho mỗi luồng.
+# Mỗi mức zoom mới chỉ tốn một lần tính bảng, các khung hình sau chỉ cần một lần remap.
+TRANSFORM_CACHE_SIZE = 8
 
 
 # --- CẤU HÌNH THIẾT BỊ BẮN (BLUETOOTH TRIGGER) ---
@@ -55,6 +58,58 @@ SESSION_DURATION_SECONDS = 87
 TOTAL_AMMO = 16
 
 
+# --- CẤU HÌNH HÀNG ĐỢI ẢNH PHÁT BẮN ---
+# Số ảnh tối đa giữ trong RAM chờ YOLO xử lý
+SHOT_BUFFER_SIZE = 30
+# Chính sách khi hàng đợi đầy (luồng cò bắn không bao giờ bị chặn):
+#   'spill'    : nén ảnh ra thư mục tạm và chấm điểm sau
+#   'unscored' : bỏ ảnh, đánh dấu phát bắn là không chấm được
+SHOT_OVERFLOW_POLICY = 'spill'
+# Thư mục tạm chứa ảnh bị spill
+SHOT_SPILL_DIR = 'spill'
+# Số ô tràn giữ ảnh thô trong RAM chờ luồng nền nén JPEG và ghi ra đĩa (~0.9 MB/ô ở 640x480).
+# Việc nén không chạy trên luồng cò bắn; khi cả các ô này cũng đầy, phát bắn bị đánh dấu 'unscored'.
+SHOT_SPILL_SLOTS = 16
+# Chu kỳ (giây) gửi số liệu hàng đợi lên server
+SHOT_BUFFER_STATS_INTERVAL = 10
+
+
+# --- CẤU HÌNH LƯU TRỮ KẾT QUẢ (SQLITE) ---
+# File cơ sở dữ liệu lưu phiên bắn, phát bắn, mục tiêu trúng và thời gian xử lý.
+# Truy vấn nhanh: python -m modules.storage hit-rate --last 10
+DB_PATH = 'shots.db'
+# Chu kỳ (giây) và số bản ghi tối đa cho mỗi lần ghi gộp xuống đĩa
+DB_FLUSH_INTERVAL = 0.5
+DB_BATCH_SIZE = 100
+# Thời gian tối đa (giây) chờ ProcessingWorker chấm xong phát đang xử lý khi tắt ứng dụng
+SHUTDOWN_PROCESSING_TIMEOUT = 10
+
+
+# --- CẤU HÌNH PHÂN BỔ CPU ---
+# Số luồng cho các thư viện tính toán (None = để thư viện tự quyết định)
+TORCH_NUM_THREADS = 2
+OPENCV_NUM_THREADS = 1
+ONNX_NUM_THREADS = 2
+# Ghim từng nhóm luồng vào các lõi CPU (Pi có 4 lõi: 0-3). Nhóm không có ở đây sẽ không bị ghim.
+# Nhóm 'inference' gồm cả thread pool nội bộ của torch (được nhận diện khi chúng xuất hiện lúc predict).
+# Lệnh 'resources' với danh sách rỗng (vd {'affinity': {'streaming': []}}) sẽ bỏ ghim nhóm đó.
+CPU_AFFINITY = {
+    'capture': [0],
+    'trigger': [0],
+    'streaming': [1],
+    'inference': [2, 3],
+}
+# Tăng độ ưu tiên (giá trị nice, càng âm càng ưu tiên) cho các luồng nhạy thời gian.
+# Giá trị âm cần chạy bằng root hoặc có quyền CAP_SYS_NICE.
+ENABLE_PRIORITY_BOOST = False
+THREAD_NICE = {
+    'capture': -5,
+    'trigger': -10,
+}
+# Chu kỳ (giây) gửi thống kê mức dùng CPU của từng nhóm luồng lên server
+CPU_USAGE_REPORT_INTERVAL = 10
+
+
 # --- CẤU HÌNH MÔ HÌNH AI (YOLO) ---
 # Đường dẫn tới file model đã huấn luyện.
 # File này phải nằm cùng cấp với thư mục `main.py`.
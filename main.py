@@ -2,10 +2,10 @@
 import threading
 import time
 import logging
-import queue
 import evdev
 import socketio
 import sys
+from datetime import datetime
 from typing import Set
 
 import config
@@ -15,6 +15,10 @@ from modules.workers import (
     CommandPoller, StatusReporterWorker, SessionMonitorWorker
 )
 from modules.audio import audio_player
+from modules.transform import normalized_to_frame_point
+from modules.shot_buffer import ShotBuffer
+from modules.storage import ShotStore
+from modules.resources import ResourceManager
 
 # Thiết lập logging (giữ nguyên từ file của bạn)
 logging.basicConfig(level=config.LOG_LEVEL, format=config.LOG_FORMAT, force=True)
@@ -34,13 +38,24 @@ class ShootingRangeApp:
         self.bullet_count = 0
         self.session_end_time = None
         self.hit_targets_session: Set[str] = set()
+        self.session_id = None
+        # Xếp loại được cập nhật dần mỗi khi có mục tiêu mới bị bắn trúng
+        self.current_achievement = self.calculate_achievement(self.hit_targets_session)
 
-        self.processing_queue = queue.Queue(maxsize=30)
+        self.shot_buffer = ShotBuffer(capacity=config.SHOT_BUFFER_SIZE, policy=config.SHOT_OVERFLOW_POLICY,
+                                      spill_dir=config.SHOT_SPILL_DIR, spill_slots=config.SHOT_SPILL_SLOTS)
         self.stop_event = threading.Event()
+        self.shot_store = ShotStore(config.DB_PATH, flush_interval=config.DB_FLUSH_INTERVAL, batch_size=config.DB_BATCH_SIZE)
 
         # --- Các thành phần (Components) ---
+        self.resources = ResourceManager(
+            torch_threads=config.TORCH_NUM_THREADS, opencv_threads=config.OPENCV_NUM_THREADS,
+            onnx_threads=config.ONNX_NUM_THREADS, affinity=config.CPU_AFFINITY,
+            nice=config.THREAD_NICE, priority_boost=config.ENABLE_PRIORITY_BOOST
+        )
         self.sio = socketio.Client(reconnection=False, logger=False) 
-        self.camera = Camera(src=config.CAMERA_INDEX, width=config.CAMERA_CAPTURE_WIDTH, height=config.CAMERA_CAPTURE_HEIGHT)
+        self.camera = Camera(src=config.CAMERA_INDEX, width=config.CAMERA_CAPTURE_WIDTH, height=config.CAMERA_CAPTURE_HEIGHT,
+                             resources=self.resources)
         self.trigger_key_code = self._get_trigger_keycode()
         
         self.video_upload_url = config.VIDEO_UPLOAD_URL
@@ -70,32 +85,38 @@ class ShootingRangeApp:
             if command_type == 'zoom':
                 self.current_zoom = float(value); logging.info(f"Lệnh ZOOM: {self.current_zoom}x")
             elif command_type == 'center':
-                w, h = config.FINAL_FRAME_WIDTH, config.FINAL_FRAME_HEIGHT
-                crop_w, crop_h = int(w / self.current_zoom), int(h / self.current_zoom)
-                x1, y1 = (w - crop_w) // 2, (h - crop_h) // 2
-                self.calibrated_center['x'] = int(x1 + float(value['x']) * crop_w)
-                self.calibrated_center['y'] = int(y1 + float(value['y']) * crop_h)
+                # Dùng cùng vùng crop (đã cache) với ảnh zoom đang được stream
+                x, y = normalized_to_frame_point(config.FINAL_FRAME_WIDTH, config.FINAL_FRAME_HEIGHT,
+                                                 self.current_zoom, value['x'], value['y'])
+                self.calibrated_center['x'], self.calibrated_center['y'] = x, y
                 logging.info(f"Tâm ngắm mới: {self.calibrated_center}")
 
     def start_session(self):
         with self.session_lock:
             self.session_active = True; self.bullet_count = config.TOTAL_AMMO
             self.hit_targets_session.clear(); self.session_end_time = time.time() + config.SESSION_DURATION_SECONDS
+            self.current_achievement = self.calculate_achievement(self.hit_targets_session)
+            self.session_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            self.shot_store.begin_session(self.session_id, time.time())
             logging.info("="*20 + " PHIÊN BẮN MỚI BẮT ĐẦU " + "="*20)
             if self.sio.connected: self.sio.emit('update_ammo', {'ammo': self.bullet_count})
 
     def reset_session(self):
         with self.session_lock:
             if self.session_active:
+                self.shot_store.end_session(self.session_id, time.time(), 'Reset', config.TOTAL_AMMO - self.bullet_count,
+                                            len(self.hit_targets_session), None)
                 self.session_active = False; self.bullet_count = 0; self.session_end_time = None
-                self.hit_targets_session.clear(); logging.info("="*20 + " PHIÊN BẮN ĐÃ ĐƯỢC RESET " + "="*20)
+                self.hit_targets_session.clear(); self.current_achievement = self.calculate_achievement(self.hit_targets_session)
+                logging.info("="*20 + " PHIÊN BẮN ĐÃ ĐƯỢC RESET " + "="*20)
                 if self.sio.connected: self.sio.emit('update_ammo', {'ammo': self.bullet_count})
     
     def end_session(self, reason: str):
         with self.session_lock:
             if self.session_active:
                 shots_fired = config.TOTAL_AMMO - self.bullet_count; hit_count = len(self.hit_targets_session)
-                achievement = self.calculate_achievement(self.hit_targets_session); self.session_active = False
+                achievement = self.current_achievement; self.session_active = False
+                self.shot_store.end_session(self.session_id, time.time(), reason, shots_fired, hit_count, achievement)
                 logging.info("="*25 + " PHIÊN BẮN ĐÃ KẾT THÚC " + "="*25)
                 if self.sio.connected: self.sio.emit('session_ended', {
                     'reason': reason,
@@ -116,12 +137,27 @@ class ShootingRangeApp:
                 self.bullet_count -= 1; logging.info(f"Đạn đã bắn! Còn lại: {self.bullet_count}")
                 if self.sio.connected: self.sio.emit('update_ammo', {'ammo': self.bullet_count})
 
-    def register_hit(self, target_name: str):
+    def register_hit(self, target_name: str, shot_id: str = None, session_id: str = None):
         with self.session_lock:
+            # Phát bắn của phiên đã reset/kết thúc (chấm trễ do hàng đợi/spill) không được tính cho phiên mới
+            if session_id is not None and session_id != self.session_id:
+                logging.info(f"Bỏ qua mục tiêu {target_name} của phát bắn {shot_id} thuộc phiên cũ {session_id}.")
+                return
             if self.session_active and target_name not in self.hit_targets_session:
                 self.hit_targets_session.add(target_name); logging.info(f"✅ Ghi nhận trúng mục tiêu: {target_name}")
-                if self.sio.connected: self.sio.emit('target_hit_update', {'target_name': target_name})
+                self.current_achievement = self.calculate_achievement(self.hit_targets_session)
+                self.shot_store.record_hit(self.session_id, target_name, shot_id, time.time())
+                if self.sio.connected: self.sio.emit('target_hit_update', {'target_name': target_name, 'achievement': self.current_achievement})
     
+    def mark_shot_unscored(self, shot_data):
+        shot_id = shot_data['shot_id']
+        logging.warning(f"⚠️ Hàng đợi đầy, phát bắn {shot_id} được đánh dấu không chấm được.")
+        self.shot_store.record_shot(shot_data, 'unscored')
+        if self.sio.connected: self.sio.emit('shot_unscored', {'shot_id': shot_id})
+
+    def get_session_id(self):
+        with self.session_lock: return self.session_id
+
     def get_session_state(self):
         with self.session_lock: return self.session_active, self.session_end_time, self.bullet_count
 
@@ -135,6 +171,9 @@ class ShootingRangeApp:
     def send_status_update(self, component, status):
         if self.sio.connected: self.sio.emit('status_update', {'component': component, 'status': status})
 
+    def send_metrics(self, name, data):
+        if self.sio.connected: self.sio.emit('metrics_update', {'name': name, 'data': data})
+
     def is_stopping(self):
         return self.stop_event.is_set()
 
@@ -168,6 +207,7 @@ class ShootingRangeApp:
         self.stop_event.clear()
 
         audio_player.load_sound('shot', config.SHOT_SOUND_PATH)
+        self.shot_store.start()
         self._setup_socketio_events()
         
         self.connection_thread = threading.Thread(target=self._connection_manager, name="_connection_manager", daemon=True)
@@ -216,6 +256,21 @@ class ShootingRangeApp:
             
         # 4. Dừng camera
         self.camera.stop()
+
+        # 5. Chờ ProcessingWorker chấm xong phát đang xử lý, rồi ghi các phát còn trong hàng đợi là 'unscored'
+        for t in self.threads:
+            if isinstance(t, ProcessingWorker) and t.is_alive():
+                t.join(timeout=config.SHUTDOWN_PROCESSING_TIMEOUT)
+                if t.is_alive():
+                    logging.warning("⚠️ ProcessingWorker chưa dừng kịp, phát bắn đang xử lý có thể không được lưu.")
+        pending_shots = self.shot_buffer.drain()
+        if pending_shots:
+            logging.warning(f"⚠️ Còn {len(pending_shots)} phát bắn chưa chấm khi tắt, ghi lại là 'unscored'.")
+        for shot_data in pending_shots:
+            self.shot_store.record_shot(shot_data, 'unscored')
+
+        # 6. Ghi nốt kết quả còn trong hàng đợi xuống cơ sở dữ liệu
+        self.shot_store.close()
         
         logging.info("✅ Ứng dụng đã dừng hoàn toàn.")
 
@@ -5,8 +5,9 @@ import time
 import logging
 
 class Camera:
-    def __init__(self, src=0, width=640, height=480):
+    def __init__(self, src=0, width=640, height=480, resources=None):
         self.src = src
+        self.resources = resources
         self.width = width
         self.height = height
         self.stream = None
@@ -21,6 +22,7 @@ class Camera:
 
     def update(self):
         while not self.stopped:
+            if self.resources: self.resources.checkpoint('capture')
             if self.stream is None or not self.stream.isOpened():
                 logging.info("Đang thử kết nối tới camera...")
                 self.stream = cv2.VideoCapture(self.src)
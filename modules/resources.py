@@ -0,0 +1,318 @@
+# file: modules/resources.py
+import os
+import threading
+import logging
+import time
+import cv2
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+def _read_thread_stat(tid):
+    """Đọc (utime + stime tính bằng tick, lõi CPU chạy gần nhất) của một luồng từ /proc."""
+    with open(f"/proc/self/task/{tid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # Sau tên luồng: fields[11] = utime, fields[12] = stime, fields[36] = processor
+    return int(fields[11]) + int(fields[12]), int(fields[36])
+
+
+def task_ids():
+    """Native id của mọi luồng trong tiến trình (rỗng nếu không có /proc)."""
+    try:
+        return {int(tid) for tid in os.listdir("/proc/self/task")}
+    except OSError:
+        return set()
+
+
+def _read_process_ticks():
+    with open("/proc/self/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return int(fields[11]) + int(fields[12])
+
+
+class ResourceManager:
+    """
+    Phân bổ 4 lõi CPU của Pi giữa các nhóm luồng (capture, trigger, streaming, inference).
+
+    Mỗi luồng nghiệp vụ gọi checkpoint(role) khi bắt đầu và trong vòng lặp của nó.
+    Số luồng của torch chỉ có hiệu lực trong luồng gọi torch.set_num_threads(), nên
+    thay đổi lúc chạy (lệnh 'resources' từ server) được áp dụng lười tại checkpoint
+    tiếp theo. Ghim CPU và độ ưu tiên nice được áp dụng ngay cho các luồng đã đăng ký.
+
+    Thread pool nội bộ của torch (làm phần lớn việc suy luận) không tự gọi checkpoint();
+    ProcessingWorker đăng ký các luồng mới xuất hiện trong lúc predict qua adopt_threads(),
+    để chúng cũng được ghim lại khi đổi affinity['inference'] và được tính vào nhóm 'inference'.
+    """
+
+    def __init__(self, torch_threads=None, opencv_threads=None, onnx_threads=None,
+                 affinity=None, nice=None, priority_boost=False):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._threads = {}        # role -> {native_id: tên luồng}
+        self._original_nice = {}  # native_id -> giá trị nice trước khi bị thay đổi
+        self._pinned = set()      # native_id đang bị ghim vào một tập lõi con
+        self._last_sample = None  # (thời điểm, {tid: ticks}, ticks của cả tiến trình)
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self._usable_cpus = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+
+        self.torch_threads = None
+        self.opencv_threads = None
+        self.onnx_threads = None
+        self.affinity = {}
+        self.nice = {}
+        self.priority_boost = False
+        # Cấu hình sai trong config.py là lỗi khi khởi động, nên để ValueError nổi lên
+        for key, value in self._parse_settings({
+            'torch_threads': torch_threads, 'opencv_threads': opencv_threads, 'onnx_threads': onnx_threads,
+            'affinity': affinity or {}, 'nice': nice or {}, 'priority_boost': priority_boost,
+        }).items():
+            setattr(self, key, value)
+        self._apply_process_settings()
+
+    # --- Cấu hình ---
+
+    @staticmethod
+    def _parse_thread_count(name, value):
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f"{name} phải là số nguyên >= 1 hoặc None, nhận được {value!r}")
+        return value
+
+    def _parse_settings(self, settings):
+        """
+        Kiểm tra và chuyển đổi cấu hình thành bản sao mới (không sửa trạng thái hiện tại).
+        Ném ValueError nếu có trường không hợp lệ.
+        """
+        if not isinstance(settings, dict):
+            raise ValueError(f"Cấu hình tài nguyên phải là dict, nhận được {type(settings).__name__}")
+        unknown = set(settings) - {'torch_threads', 'opencv_threads', 'onnx_threads', 'affinity', 'nice', 'priority_boost'}
+        if unknown:
+            raise ValueError(f"Trường cấu hình không hỗ trợ: {sorted(unknown)}")
+
+        parsed = {}
+        for key in ('torch_threads', 'opencv_threads', 'onnx_threads'):
+            if key in settings:
+                parsed[key] = self._parse_thread_count(key, settings[key])
+
+        if 'affinity' in settings:
+            if not isinstance(settings['affinity'], dict):
+                raise ValueError("affinity phải là dict {nhóm: [lõi CPU, ...]}")
+            affinity = dict(self.affinity)
+            for role, cpus in settings['affinity'].items():
+                if not cpus:
+                    affinity.pop(role, None)
+                    continue
+                if not isinstance(cpus, (list, tuple, set)) or \
+                        not all(isinstance(c, int) and not isinstance(c, bool) and c >= 0 for c in cpus):
+                    raise ValueError(f"affinity['{role}'] phải là danh sách chỉ số lõi CPU, nhận được {cpus!r}")
+                affinity[role] = set(cpus)
+            parsed['affinity'] = affinity
+
+        if 'nice' in settings:
+            if not isinstance(settings['nice'], dict):
+                raise ValueError("nice phải là dict {nhóm: giá trị nice}")
+            nice = dict(self.nice)
+            for role, value in settings['nice'].items():
+                if value is None:
+                    nice.pop(role, None)
+                    continue
+                if isinstance(value, bool) or not isinstance(value, int) or not -20 <= value <= 19:
+                    raise ValueError(f"nice['{role}'] phải là số nguyên trong [-20, 19], nhận được {value!r}")
+                nice[role] = value
+            parsed['nice'] = nice
+
+        if 'priority_boost' in settings:
+            if not isinstance(settings['priority_boost'], bool):
+                raise ValueError(f"priority_boost phải là true/false, nhận được {settings['priority_boost']!r}")
+            parsed['priority_boost'] = settings['priority_boost']
+        return parsed
+
+    def _apply_process_settings(self):
+        # Thread pool của OpenCV dùng chung cho cả tiến trình
+        if self.opencv_threads is not None:
+            cv2.setNumThreads(self.opencv_threads)
+            logging.info(f"OpenCV dùng {cv2.getNumThreads()} luồng.")
+
+    def update(self, settings):
+        """
+        Thay đổi phân bổ lúc chạy, ví dụ {'torch_threads': 3, 'affinity': {'inference': [1, 2, 3]}}.
+        Cấu hình không hợp lệ bị từ chối toàn bộ (giữ nguyên cấu hình cũ). Trả về True nếu đã áp dụng.
+        """
+        try:
+            with self._lock:
+                parsed = self._parse_settings(settings)
+        except ValueError as e:
+            logging.warning(f"⚠️ Bỏ qua lệnh thay đổi tài nguyên không hợp lệ: {e}")
+            return False
+
+        with self._lock:
+            for key, value in parsed.items():
+                setattr(self, key, value)
+            self._generation += 1
+            registered = [(role, tid) for role, tids in self._threads.items() for tid in tids]
+        self._apply_process_settings()
+        # Ghim CPU và nice áp dụng được cho luồng khác qua native id, nên cập nhật ngay
+        for role, tid in registered:
+            self._set_affinity(role, tid)
+            self._apply_nice(role, tid)
+        logging.info(f"Đã cập nhật phân bổ tài nguyên CPU: {settings}")
+        return True
+
+    def onnx_session_options(self):
+        """SessionOptions cho onnxruntime với số luồng đã cấu hình (None nếu chưa cài onnxruntime)."""
+        if onnxruntime is None:
+            return None
+        options = onnxruntime.SessionOptions()
+        if self.onnx_threads is not None:
+            options.intra_op_num_threads = self.onnx_threads
+            options.inter_op_num_threads = 1
+        return options
+
+    # --- Áp dụng cho từng luồng ---
+
+    def checkpoint(self, role):
+        """
+        Đăng ký luồng hiện tại vào nhóm `role` và áp dụng cấu hình nếu có thay đổi kể từ lần gọi trước.
+        Không bao giờ ném lỗi, để một cấu hình hỏng không làm chết luồng nghiệp vụ.
+        """
+        if getattr(self._local, 'generation', None) == self._generation:
+            return
+        tid = threading.get_native_id()
+        with self._lock:
+            self._local.generation = self._generation
+            # Một luồng có thể đã bị adopt_threads() gán nhầm nhóm khác trước khi tự đăng ký
+            for tids in self._threads.values():
+                tids.pop(tid, None)
+            self._threads.setdefault(role, {})[tid] = threading.current_thread().name
+            torch_threads = self.torch_threads
+
+        try:
+            if torch is not None and torch_threads is not None and role == 'inference':
+                torch.set_num_threads(torch_threads)
+                logging.info(f"Torch dùng {torch.get_num_threads()} luồng cho nhóm '{role}'.")
+            self._set_affinity(role, tid)
+            self._apply_nice(role, tid)
+        except Exception as e:
+            logging.warning(f"⚠️ Không thể áp dụng cấu hình tài nguyên cho nhóm '{role}': {e}")
+
+    def adopt_threads(self, role, tids):
+        """
+        Đăng ký các luồng không tự gọi checkpoint() (ví dụ thread pool của torch, do luồng
+        inference tạo ra trong lúc predict) vào nhóm `role` và áp dụng ghim CPU/nice cho chúng.
+        Luồng đã đăng ký ở nhóm khác được giữ nguyên.
+        """
+        with self._lock:
+            registered = {tid for role_tids in self._threads.values() for tid in role_tids}
+            new_tids = [tid for tid in tids if tid not in registered]
+            for tid in new_tids:
+                self._threads.setdefault(role, {})[tid] = f"pool-{tid}"
+        for tid in new_tids:
+            try:
+                self._set_affinity(role, tid)
+                self._apply_nice(role, tid)
+            except Exception as e:
+                logging.warning(f"⚠️ Không thể áp dụng cấu hình tài nguyên cho luồng {tid} ({role}): {e}")
+        if new_tids:
+            logging.info(f"Đã đăng ký {len(new_tids)} luồng nội bộ vào nhóm '{role}'.")
+
+    def _set_affinity(self, role, tid):
+        if not hasattr(os, 'sched_setaffinity'):
+            return
+        cpus = self.affinity.get(role)
+        if not cpus:
+            # Nhóm đã bị bỏ ghim: trả luồng về toàn bộ lõi mà tiến trình được phép dùng
+            if tid in self._pinned and self._usable_cpus:
+                try:
+                    os.sched_setaffinity(tid, self._usable_cpus)
+                    self._pinned.discard(tid)
+                except OSError as e:
+                    logging.warning(f"⚠️ Không thể bỏ ghim CPU cho luồng {tid} ({role}): {e}")
+            return
+        if self._usable_cpus is not None:
+            cpus = cpus & self._usable_cpus
+        if not cpus:
+            logging.warning(f"⚠️ Không có lõi CPU hợp lệ cho nhóm '{role}', bỏ qua việc ghim CPU.")
+            return
+        try:
+            os.sched_setaffinity(tid, cpus)
+            self._pinned.add(tid)
+        except OSError as e:
+            logging.warning(f"⚠️ Không thể ghim luồng {tid} ({role}) vào CPU {sorted(cpus)}: {e}")
+
+    def _apply_nice(self, role, tid):
+        """Đặt nice theo cấu hình, hoặc trả về giá trị ban đầu khi tắt priority_boost/bỏ nhóm khỏi `nice`."""
+        with self._lock:
+            target = self.nice.get(role) if self.priority_boost else None
+            try:
+                if target is None:
+                    original = self._original_nice.pop(tid, None)
+                    if original is not None:
+                        os.setpriority(os.PRIO_PROCESS, tid, original)
+                    return
+                if tid not in self._original_nice:
+                    self._original_nice[tid] = os.getpriority(os.PRIO_PROCESS, tid)
+                os.setpriority(os.PRIO_PROCESS, tid, target)
+            except (OSError, AttributeError) as e:
+                # Giảm giá trị nice (tăng ưu tiên) cần quyền root hoặc CAP_SYS_NICE
+                logging.warning(f"⚠️ Không thể đặt độ ưu tiên nice={target} cho nhóm '{role}': {e}")
+
+    # --- Thống kê ---
+
+    def cpu_usage(self):
+        """
+        Mức dùng CPU của từng nhóm luồng kể từ lần gọi trước (100% = một lõi).
+        'other' gồm các luồng không đăng ký, ví dụ thread pool nội bộ của torch/OpenCV.
+        """
+        now = time.time()
+        with self._lock:
+            registered = {role: dict(tids) for role, tids in self._threads.items()}
+
+        ticks, cpus, dead = {}, {}, []
+        for role, tids in registered.items():
+            for tid in tids:
+                try:
+                    ticks[tid], cpus[tid] = _read_thread_stat(tid)
+                except (OSError, IndexError, ValueError):
+                    dead.append((role, tid))
+        if dead:
+            with self._lock:
+                for role, tid in dead:
+                    self._threads.get(role, {}).pop(tid, None)
+                    self._original_nice.pop(tid, None)
+                    self._pinned.discard(tid)
+        try:
+            process_ticks = _read_process_ticks()
+        except (OSError, IndexError, ValueError):
+            return {}
+
+        previous = self._last_sample
+        self._last_sample = (now, ticks, process_ticks)
+        if previous is None:
+            return {}
+        prev_time, prev_ticks, prev_process_ticks = previous
+        elapsed = max(now - prev_time, 1e-6) * self._clock_ticks
+
+        usage, registered_delta = {}, 0
+        for role, tids in registered.items():
+            role_delta = sum(ticks[tid] - prev_ticks.get(tid, ticks[tid]) for tid in tids if tid in ticks)
+            registered_delta += role_delta
+            usage[role] = {
+                'cpu_percent': round(100 * role_delta / elapsed, 1),
+                'threads': sum(1 for tid in tids if tid in ticks),
+                'last_cpus': sorted({cpus[tid] for tid in tids if tid in cpus}),
+                'affinity': sorted(self.affinity.get(role, [])),
+            }
+        total_delta = process_ticks - prev_process_ticks
+        usage['other'] = {'cpu_percent': round(100 * max(total_delta - registered_delta, 0) / elapsed, 1)}
+        usage['total'] = {'cpu_percent': round(100 * total_delta / elapsed, 1)}
+        return usage
@@ -0,0 +1,218 @@
+# file: modules/shot_buffer.py
+import threading
+import logging
+import queue
+import os
+import glob
+from collections import deque
+import cv2
+
+# Chính sách khi bộ đệm đầy
+POLICY_SPILL = 'spill'          # Nén ảnh JPEG ra thư mục tạm, xử lý sau
+POLICY_UNSCORED = 'unscored'    # Bỏ ảnh, đánh dấu phát bắn là "không chấm được"
+
+# Kết quả trả về của put()
+SHOT_QUEUED = 'queued'
+SHOT_SPILLED = 'spilled'
+SHOT_UNSCORED = 'unscored'
+
+
+class ShotBuffer:
+    """
+    Hàng đợi ảnh phát bắn giữa TriggerListener và ProcessingWorker.
+    put() không bao giờ chặn luồng cò bắn: khi bộ đệm vòng trong RAM đầy, ảnh được
+    chuyển vào một số ô tràn cố định để luồng nền nén và spill ra đĩa, hoặc phát bắn
+    bị đánh dấu 'unscored' tùy theo chính sách (và khi các ô tràn cũng đã đầy).
+    """
+
+    def __init__(self, capacity=30, policy=POLICY_SPILL, spill_dir="spill", spill_slots=16, jpeg_quality=95):
+        if policy not in (POLICY_SPILL, POLICY_UNSCORED):
+            raise ValueError(f"Chính sách tràn bộ đệm không hợp lệ: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.spill_slots = spill_slots
+        self.jpeg_quality = jpeg_quality
+
+        # Mỗi phần tử là (số thứ tự, phát bắn) để get() luôn trả về phát bắn cũ nhất
+        self._ring = deque()
+        self._overflow = deque()  # Ảnh thô đang chờ luồng nền nén và ghi ra đĩa
+        self._spilled = deque()   # Ảnh đã nằm trên đĩa, chờ được chấm
+        self._cond = threading.Condition()
+        self._unfinished = 0
+        self._next_seq = 0
+        self._spilling_seq = None  # Số thứ tự của ảnh SpillWriter đang ghi dở
+
+        # Số liệu thống kê
+        self._high_water = 0
+        self._total_queued = 0
+        self._total_spilled = 0
+        self._total_unscored = 0
+        self._spill_errors = 0
+
+        if self.policy == POLICY_SPILL:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # Ảnh spill từ lần chạy trước không chấm lại được: thông tin phát bắn (phiên, tâm ngắm,
+            # zoom) chỉ nằm trong RAM và đã mất khi tiến trình dừng, nên xóa đi và ghi log
+            stale_files = glob.glob(os.path.join(self.spill_dir, "*.jpg"))
+            if stale_files:
+                logging.warning(f"⚠️ Bỏ {len(stale_files)} ảnh spill chưa được chấm từ lần chạy trước trong '{self.spill_dir}'.")
+            for stale in stale_files:
+                try: os.remove(stale)
+                except OSError: pass
+            threading.Thread(target=self._spill_writer, name="SpillWriter", daemon=True).start()
+
+    def reserve(self):
+        """
+        Giữ chỗ cho một phát bắn sắp được đưa vào (gọi trước khi trừ đạn), để
+        unfinished() không về 0 trong khoảng giữa lúc trừ đạn và lúc put().
+        Phải được trả lại bằng put(..., reserved=True) hoặc release().
+        """
+        with self._cond:
+            self._unfinished += 1
+
+    def release(self):
+        """Trả lại một chỗ đã giữ mà không đưa phát bắn nào vào (ví dụ khi không đọc được khung hình)."""
+        self.task_done()
+
+    def put(self, shot_data, reserved=False):
+        """Đưa một phát bắn vào hàng đợi mà không chặn. Trả về SHOT_QUEUED/SHOT_SPILLED/SHOT_UNSCORED."""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            if len(self._ring) < self.capacity:
+                self._ring.append((seq, shot_data))
+                result = SHOT_QUEUED
+                self._total_queued += 1
+                self._high_water = max(self._high_water, len(self._ring))
+            elif self.policy == POLICY_SPILL and len(self._overflow) < self.spill_slots:
+                # Chỉ giữ tham chiếu tới ảnh; việc nén JPEG và ghi đĩa do luồng SpillWriter làm
+                self._overflow.append((seq, shot_data))
+                result = SHOT_SPILLED
+                self._total_spilled += 1
+            else:
+                self._total_unscored += 1
+                if reserved and self._unfinished > 0:
+                    self._unfinished -= 1
+                return SHOT_UNSCORED
+            if not reserved:
+                self._unfinished += 1
+            self._cond.notify_all()
+            return result
+
+    def _spill_writer(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._overflow)
+                seq, shot_data = self._overflow.popleft()
+                self._spilling_seq = seq
+            record = self._spill(shot_data)
+            with self._cond:
+                self._spilling_seq = None
+                if record is not None:
+                    self._spilled.append((seq, record))
+                else:
+                    # Phát bắn bị mất ảnh, coi như không chấm được
+                    self._total_unscored += 1
+                    if self._unfinished > 0:
+                        self._unfinished -= 1
+                self._cond.notify_all()
+
+    def _spill(self, shot_data):
+        """Nén ảnh và ghi ra thư mục tạm (chạy trong luồng SpillWriter, ngoài khóa)."""
+        path = os.path.join(self.spill_dir, f"{shot_data['shot_id']}_{shot_data['timestamp'].strftime('%H%M%S_%f')}.jpg")
+        try:
+            ok, buffer = cv2.imencode('.jpg', shot_data['frame'], [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ok:
+                raise IOError("cv2.imencode thất bại")
+            with open(path, 'wb') as f:
+                f.write(buffer.tobytes())
+        except Exception as e:
+            logging.error(f"Lỗi khi spill phát bắn {shot_data['shot_id']} ra đĩa, phát bắn sẽ không được chấm: {e}")
+            with self._cond:
+                self._spill_errors += 1
+            return None
+        record = {k: v for k, v in shot_data.items() if k != 'frame'}
+        record['spill_path'] = path
+        return record
+
+    def _load_spilled(self, record):
+        path = record.pop('spill_path')
+        frame = cv2.imread(path)
+        try: os.remove(path)
+        except OSError: pass
+        record['frame'] = frame
+        record['spilled'] = True
+        return record
+
+    def _oldest_source(self):
+        """Hàng đợi chứa phát bắn cũ nhất, hoặc None nếu chưa có gì (hoặc phát cũ nhất đang được ghi ra đĩa)."""
+        heads = [(q[0][0], i, q) for i, q in enumerate((self._ring, self._spilled, self._overflow)) if q]
+        if not heads:
+            return None
+        seq, _, source = min(heads)
+        if self._spilling_seq is not None and self._spilling_seq < seq:
+            return None
+        return source
+
+    def get(self, timeout=None):
+        """
+        Lấy phát bắn cũ nhất theo thứ tự bắn, dù nó đang ở bộ đệm RAM, trên đĩa hay trong ô tràn
+        (ảnh trong ô tràn được lấy thẳng từ RAM, khỏi phải nén). Ném queue.Empty nếu hết giờ chờ.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._oldest_source() is not None, timeout=timeout):
+                raise queue.Empty
+            source = self._oldest_source()
+            _, item = source.popleft()
+            if source is self._ring:
+                return item
+            if source is self._overflow:
+                item['spilled'] = True
+                return item
+        return self._load_spilled(item)
+
+    def drain(self):
+        """
+        Lấy ra mọi phát bắn chưa chấm (không kèm ảnh) khi tắt ứng dụng, để còn ghi lại là 'unscored'.
+        Ảnh đã spill ra đĩa được xóa vì lần chạy sau không chấm lại được.
+        """
+        with self._cond:
+            items = sorted(list(self._ring) + list(self._spilled) + list(self._overflow), key=lambda e: e[0])
+            self._ring.clear(); self._spilled.clear(); self._overflow.clear()
+            self._unfinished = max(self._unfinished - len(items), 0)
+        pending = []
+        for _, item in items:
+            path = item.pop('spill_path', None)
+            if path:
+                try: os.remove(path)
+                except OSError: pass
+            pending.append({k: v for k, v in item.items() if k != 'frame'})
+        return pending
+
+    def task_done(self):
+        """Báo một phát bắn đã được chấm xong (kể cả khi xử lý lỗi)."""
+        with self._cond:
+            if self._unfinished > 0:
+                self._unfinished -= 1
+
+    def unfinished(self):
+        """Số phát bắn đã giữ chỗ/nhận nhưng chưa chấm xong (trong RAM, trên đĩa hoặc đang xử lý)."""
+        with self._cond:
+            return self._unfinished
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._ring),
+                'capacity': self.capacity,
+                'high_water': self._high_water,
+                'spill_queue': len(self._overflow),
+                'spill_pending': len(self._spilled),
+                'unfinished': self._unfinished,
+                'total_queued': self._total_queued,
+                'total_spilled': self._total_spilled,
+                'total_unscored': self._total_unscored,
+                'spill_errors': self._spill_errors,
+                'policy': self.policy,
+            }
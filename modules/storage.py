@@ -0,0 +1,269 @@
+# file: modules/storage.py
+import threading
+import logging
+import queue
+import sqlite3
+import argparse
+import time
+import os
+import sys
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    started_at   REAL NOT NULL,
+    ended_at     REAL,
+    end_reason   TEXT,
+    total_shots  INTEGER,
+    hit_count    INTEGER,
+    achievement  TEXT
+);
+CREATE TABLE IF NOT EXISTS shots (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id    TEXT,
+    shot_id       TEXT NOT NULL,
+    burst_id      INTEGER,
+    shot_index    INTEGER,
+    fired_at      REAL NOT NULL,
+    zoom          REAL,
+    center_x      INTEGER,
+    center_y      INTEGER,
+    status        TEXT NOT NULL,
+    spilled       INTEGER NOT NULL DEFAULT 0,
+    target_name   TEXT,
+    queue_wait_ms REAL,
+    inference_ms  REAL,
+    total_ms      REAL
+);
+CREATE TABLE IF NOT EXISTS hits (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id   TEXT NOT NULL,
+    target_name  TEXT NOT NULL,
+    shot_id      TEXT,
+    hit_at       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_started ON sessions(started_at);
+CREATE INDEX IF NOT EXISTS idx_shots_session ON shots(session_id);
+CREATE INDEX IF NOT EXISTS idx_shots_fired ON shots(fired_at);
+CREATE INDEX IF NOT EXISTS idx_shots_target ON shots(target_name);
+CREATE INDEX IF NOT EXISTS idx_hits_session ON hits(session_id);
+CREATE INDEX IF NOT EXISTS idx_hits_target ON hits(target_name);
+CREATE INDEX IF NOT EXISTS idx_hits_time ON hits(hit_at);
+"""
+
+_STOP = object()
+
+# Chỉ thống kê các phiên đã kết thúc bình thường (bỏ phiên đang chạy và phiên bị reset)
+_FINISHED_SESSIONS = "SELECT session_id FROM sessions WHERE ended_at IS NOT NULL AND end_reason <> 'Reset' ORDER BY started_at DESC LIMIT ?"
+
+
+def connect(db_path):
+    """Mở kết nối SQLite ở chế độ WAL (cho phép đọc song song trong khi luồng ghi đang chạy)."""
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Cơ sở dữ liệu tạo từ phiên bản cũ chưa có cột spilled
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(shots)")}
+    if 'spilled' not in columns:
+        conn.execute("ALTER TABLE shots ADD COLUMN spilled INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+
+def connect_readonly(db_path):
+    """Mở kết nối chỉ đọc cho API truy vấn/CLI; không tạo file mới nếu đường dẫn sai."""
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Không tìm thấy cơ sở dữ liệu '{db_path}'")
+    return sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+
+
+class ShotStore:
+    """
+    Lưu phiên bắn, phát bắn, mục tiêu trúng và thời gian xử lý vào SQLite.
+    Các hàm record_*() chỉ đưa lệnh vào hàng đợi; việc ghi xuống đĩa được gom
+    thành từng lô và thực hiện bởi một luồng nền riêng.
+    """
+
+    def __init__(self, db_path="shots.db", flush_interval=0.5, batch_size=100):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer_loop, name="ShotStoreWriter", daemon=True)
+        self._closed = False
+        self.dropped = 0  # Số bản ghi bị bỏ vì đến sau khi close()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Ghi nốt các lệnh còn trong hàng đợi rồi dừng luồng ghi."""
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _enqueue(self, sql, params):
+        if self._closed:
+            self.dropped += 1
+            logging.warning(f"⚠️ Cơ sở dữ liệu đã đóng, bỏ bản ghi (tổng cộng {self.dropped}): {params}")
+            return
+        self._queue.put((sql, params))
+
+    # --- Các hàm ghi (gọi từ luồng nghiệp vụ, không chạm vào cơ sở dữ liệu) ---
+
+    def begin_session(self, session_id, started_at):
+        self._enqueue("INSERT OR REPLACE INTO sessions (session_id, started_at) VALUES (?, ?)",
+                      (session_id, started_at))
+
+    def end_session(self, session_id, ended_at, reason, total_shots, hit_count, achievement):
+        self._enqueue("UPDATE sessions SET ended_at = ?, end_reason = ?, total_shots = ?, hit_count = ?, achievement = ? "
+                      "WHERE session_id = ?",
+                      (ended_at, reason, total_shots, hit_count, achievement, session_id))
+
+    def record_shot(self, shot_data, status, target_name=None, queue_wait_ms=None, inference_ms=None, total_ms=None):
+        center = shot_data.get('center') or {}
+        self._enqueue("INSERT INTO shots (session_id, shot_id, burst_id, shot_index, fired_at, zoom, center_x, center_y, "
+                      "status, spilled, target_name, queue_wait_ms, inference_ms, total_ms) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      (shot_data.get('session_id'), shot_data['shot_id'], shot_data.get('burst_id'),
+                       shot_data.get('shot_index'), shot_data['timestamp'].timestamp(), shot_data.get('zoom'),
+                       center.get('x'), center.get('y'), status, int(bool(shot_data.get('spilled'))), target_name,
+                       queue_wait_ms, inference_ms, total_ms))
+
+    def record_hit(self, session_id, target_name, shot_id, hit_at):
+        self._enqueue("INSERT INTO hits (session_id, target_name, shot_id, hit_at) VALUES (?, ?, ?, ?)",
+                      (session_id, target_name, shot_id, hit_at))
+
+    # --- Luồng ghi nền ---
+
+    def _writer_loop(self):
+        try:
+            conn = connect(self.db_path)
+        except sqlite3.Error as e:
+            logging.error(f"❌ Không thể mở cơ sở dữ liệu '{self.db_path}': {e}. Kết quả sẽ không được lưu.")
+            return
+        logging.info(f"Luồng ghi cơ sở dữ liệu bắt đầu ({self.db_path}).")
+
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if batch:
+                try:
+                    with conn:
+                        for sql, params in batch:
+                            conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    logging.error(f"Lỗi khi ghi {len(batch)} bản ghi vào cơ sở dữ liệu: {e}")
+
+        conn.close()
+        logging.info("Luồng ghi cơ sở dữ liệu đã dừng.")
+
+
+# --- API truy vấn (mở kết nối chỉ đọc riêng, không ảnh hưởng luồng ghi) ---
+
+def _query(db_path, sql, params=()):
+    conn = connect_readonly(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [dict(r) for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def recent_sessions(db_path, limit=10):
+    """Danh sách các phiên gần nhất, mới nhất trước."""
+    return _query(db_path, "SELECT * FROM sessions ORDER BY started_at DESC LIMIT ?", (limit,))
+
+
+def target_hit_rate(db_path, last_n_sessions=10):
+    """
+    Tỉ lệ trúng theo từng mục tiêu trong N phiên đã kết thúc gần nhất (không tính phiên bị reset).
+
+    Returns:
+        list[dict]: [{'target_name', 'sessions_hit', 'sessions', 'hit_rate'}], sắp xếp theo tỉ lệ giảm dần.
+    """
+    rows = _query(db_path, f"""
+            WITH recent AS ({_FINISHED_SESSIONS})
+            SELECT h.target_name AS target_name,
+                   COUNT(DISTINCT h.session_id) AS sessions_hit,
+                   (SELECT COUNT(*) FROM recent) AS sessions
+            FROM hits h JOIN recent r ON h.session_id = r.session_id
+            GROUP BY h.target_name
+        """, (last_n_sessions,))
+    result = [dict(r, hit_rate=r['sessions_hit'] / r['sessions']) for r in rows]
+    return sorted(result, key=lambda r: r['hit_rate'], reverse=True)
+
+
+def shot_timings(db_path, last_n_sessions=10):
+    """Thời gian xử lý trung bình/tối đa (ms) của các phát bắn trong N phiên đã kết thúc gần nhất."""
+    rows = _query(db_path, f"""
+            SELECT COUNT(*) AS shots,
+                   SUM(status = 'scored') AS scored,
+                   SUM(status = 'unscored') AS unscored,
+                   SUM(status = 'error') AS errors,
+                   SUM(spilled) AS spilled,
+                   AVG(queue_wait_ms) AS avg_queue_wait_ms, MAX(queue_wait_ms) AS max_queue_wait_ms,
+                   AVG(inference_ms) AS avg_inference_ms, MAX(inference_ms) AS max_inference_ms,
+                   AVG(total_ms) AS avg_total_ms
+            FROM shots
+            WHERE session_id IN ({_FINISHED_SESSIONS})
+        """, (last_n_sessions,))
+    return rows[0]
+
+
+def main(argv=None):
+    import config
+    parser = argparse.ArgumentParser(description="Truy vấn kết quả bắn đã lưu.")
+    parser.add_argument('--db', default=config.DB_PATH, help="Đường dẫn file SQLite")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('sessions', help="Liệt kê các phiên gần nhất")
+    p.add_argument('--last', type=int, default=10)
+    p = sub.add_parser('hit-rate', help="Tỉ lệ trúng theo mục tiêu trong N phiên đã kết thúc gần nhất")
+    p.add_argument('--last', type=int, default=10)
+    p = sub.add_parser('timings', help="Thời gian xử lý phát bắn trong N phiên đã kết thúc gần nhất")
+    p.add_argument('--last', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    try:
+        _run_command(args)
+    except (FileNotFoundError, sqlite3.Error) as e:
+        print(f"❌ Lỗi: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _run_command(args):
+    if args.command == 'sessions':
+        for s in recent_sessions(args.db, args.last):
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s['started_at']))
+            print(f"{s['session_id']}  {started}  bắn={s['total_shots']}  trúng={s['hit_count']}  "
+                  f"{s['achievement'] or '-'}  ({s['end_reason'] or 'chưa kết thúc'})")
+    elif args.command == 'hit-rate':
+        for r in target_hit_rate(args.db, args.last):
+            print(f"{r['target_name']:<15} {r['sessions_hit']}/{r['sessions']}  {r['hit_rate']:.0%}")
+    elif args.command == 'timings':
+        for key, value in shot_timings(args.db, args.last).items():
+            print(f"{key:<20} {value if value is not None else '-'}")
+
+
+if __name__ == '__main__':
+    main()
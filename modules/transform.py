@@ -0,0 +1,136 @@
+# file: modules/transform.py
+import threading
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+import cv2
+import numpy as np
+from .utils import draw_crosshair
+
+
+def rotated_size(width, height, rotation):
+    """Trả về kích thước (w, h) của khung hình sau khi xoay theo mã cv2.ROTATE_*."""
+    if rotation in (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE):
+        return height, width
+    return width, height
+
+
+@lru_cache(maxsize=32)
+def compute_crop_region(width, height, zoom_level):
+    """Vùng crop trung tâm (x1, y1, crop_w, crop_h) ứng với mức zoom (crop quanh tâm khung hình)."""
+    if zoom_level <= 1.0:
+        return 0, 0, width, height
+    crop_w = int(width / zoom_level)
+    crop_h = int(height / zoom_level)
+    x1 = width // 2 - crop_w // 2
+    y1 = height // 2 - crop_h // 2
+    return x1, y1, crop_w, crop_h
+
+
+def normalized_to_frame_point(width, height, zoom_level, nx, ny):
+    """Đổi tọa độ chuẩn hóa (0..1) trên ảnh đã zoom về tọa độ trên khung hình gốc (đã xoay)."""
+    x1, y1, crop_w, crop_h = compute_crop_region(width, height, zoom_level)
+    return int(x1 + float(nx) * crop_w), int(y1 + float(ny) * crop_h)
+
+
+class TransformPlan:
+    """Bảng remap đã tính sẵn cho một bộ (kích thước nguồn, hướng xoay, zoom, kích thước đầu ra)."""
+
+    def __init__(self, src_size, rotation, zoom_level, out_size):
+        src_w, src_h = src_size
+        rot_w, rot_h = rotated_size(src_w, src_h, rotation)
+        out_w, out_h = out_size if out_size else (rot_w, rot_h)
+        self.out_size = (out_w, out_h)
+        self.crop_region = compute_crop_region(rot_w, rot_h, zoom_level)
+        x1, y1, crop_w, crop_h = self.crop_region
+        self.scale_x = out_w / crop_w
+        self.scale_y = out_h / crop_h
+
+        # Tọa độ trên khung hình đã xoay, theo cùng quy ước tâm pixel với cv2.resize
+        rx = x1 + (np.arange(out_w, dtype=np.float32) + 0.5) / self.scale_x - 0.5
+        ry = y1 + (np.arange(out_h, dtype=np.float32) + 0.5) / self.scale_y - 0.5
+        grid_x, grid_y = np.meshgrid(rx, ry)
+
+        # Ánh xạ ngược từ khung hình đã xoay về khung hình gốc của camera
+        if rotation == cv2.ROTATE_90_CLOCKWISE:
+            map_x, map_y = grid_y, (src_h - 1) - grid_x
+        elif rotation == cv2.ROTATE_90_COUNTERCLOCKWISE:
+            map_x, map_y = (src_w - 1) - grid_y, grid_x
+        elif rotation == cv2.ROTATE_180:
+            map_x, map_y = (src_w - 1) - grid_x, (src_h - 1) - grid_y
+        else:
+            map_x, map_y = grid_x, grid_y
+
+        # Chuyển sang dạng fixed-point để cv2.remap chạy nhanh hơn trên ARM
+        self.map1, self.map2 = cv2.convertMaps(
+            np.ascontiguousarray(map_x, dtype=np.float32),
+            np.ascontiguousarray(map_y, dtype=np.float32),
+            cv2.CV_16SC2
+        )
+        self._last_center = None
+        self._last_marker = None
+
+    def marker_position(self, center_point):
+        """Vị trí vẽ tâm ngắm trên ảnh đầu ra, hoặc None nếu tâm ngắm nằm ngoài vùng nhìn thấy."""
+        center = (center_point['x'], center_point['y'])
+        if center != self._last_center:
+            x1, y1, crop_w, crop_h = self.crop_region
+            cx, cy = center
+            if x1 <= cx < x1 + crop_w and y1 <= cy < y1 + crop_h:
+                self._last_marker = (int((cx - x1) * self.scale_x), int((cy - y1) * self.scale_y))
+            else:
+                self._last_marker = None
+            self._last_center = center
+        return self._last_marker
+
+
+class FrameTransformer:
+    """
+    Gộp xoay + zoom + vẽ tâm ngắm thành một lần remap duy nhất vào buffer dùng lại.
+    Mỗi luồng nên có một thực thể riêng vì buffer đầu ra được tái sử dụng giữa các lần gọi.
+    """
+
+    def __init__(self, rotation=cv2.ROTATE_90_CLOCKWISE, out_size=None, cache_size=8):
+        self.rotation = rotation
+        self.out_size = out_size
+        self.cache_size = max(1, cache_size)
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self._buffer = None
+
+    def get_plan(self, src_size, zoom_level):
+        """Lấy bảng remap từ cache (LRU), chỉ tính mới khi zoom/kích thước thay đổi."""
+        key = (src_size, float(zoom_level), self.rotation, self.out_size)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+            plan = TransformPlan(src_size, self.rotation, float(zoom_level), self.out_size)
+            self._plans[key] = plan
+            if len(self._plans) > self.cache_size:
+                self._plans.popitem(last=False)
+            logging.debug(f"Đã tạo bảng remap mới: zoom={zoom_level}, nguồn={src_size}, đầu ra={plan.out_size}")
+            return plan
+
+    def render(self, frame, zoom_level, center_point=None):
+        """
+        Xoay, crop và phóng to khung hình trong một lần duyệt, sau đó vẽ tâm ngắm.
+        Kết quả nằm trong buffer nội bộ và sẽ bị ghi đè ở lần gọi tiếp theo.
+        """
+        if frame is None:
+            return None
+        h, w = frame.shape[:2]
+        plan = self.get_plan((w, h), zoom_level)
+        out_w, out_h = plan.out_size
+        out_shape = (out_h, out_w) + frame.shape[2:]
+        if self._buffer is None or self._buffer.shape != out_shape or self._buffer.dtype != frame.dtype:
+            self._buffer = np.empty(out_shape, dtype=frame.dtype)
+
+        cv2.remap(frame, plan.map1, plan.map2, cv2.INTER_LINEAR, dst=self._buffer, borderMode=cv2.BORDER_REPLICATE)
+
+        if center_point is not None:
+            marker = plan.marker_position(center_point)
+            if marker is not None:
+                draw_crosshair(self._buffer, marker)
+        return self._buffer
@@ -9,9 +9,13 @@ import logging
 import os
 import base64
 from datetime import datetime
-from .utils import draw_crosshair_on_frame
+import config
+from .transform import FrameTransformer
+from .utils import draw_crosshair
 from .audio import audio_player
 from .yolo_predictor import analyze_shot
+from .shot_buffer import SHOT_SPILLED, SHOT_UNSCORED
+from .resources import task_ids
 
 # LƯU Ý: Các lớp Worker đã được cập nhật để nhận vào một đối tượng 'app' duy nhất.
 
@@ -36,10 +40,25 @@ class StatusReporterWorker(threading.Thread):
         self.app = app
         self.trigger_listener = trigger_listener
         self.camera = camera
+        self.last_stats_time = 0
+        self.last_cpu_report_time = 0
 
     def run(self):
         logging.info("Luồng Giám sát Trạng thái bắt đầu.")
         while not self.app.is_stopping():
+            if time.time() - self.last_stats_time >= config.SHOT_BUFFER_STATS_INTERVAL:
+                stats = self.app.shot_buffer.stats()
+                logging.debug(f"Hàng đợi ảnh: {stats}")
+                self.app.send_metrics('shot_buffer', stats)
+                self.last_stats_time = time.time()
+
+            if time.time() - self.last_cpu_report_time >= config.CPU_USAGE_REPORT_INTERVAL:
+                usage = self.app.resources.cpu_usage()
+                if usage:
+                    logging.debug(f"Mức dùng CPU theo nhóm luồng: {usage}")
+                    self.app.send_metrics('cpu_usage', usage)
+                self.last_cpu_report_time = time.time()
+
             if self.trigger_listener.is_connected():
                 self.app.send_status_update('trigger', 'ready')
             else:
@@ -73,11 +92,14 @@ class TriggerListener(threading.Thread):
         return None
 
     def fire_one_burst(self, current_burst_id):
+        self.app.resources.checkpoint('trigger')
         shot_in_burst_index = 0
         while self.trigger_held:
             if self.app.is_stopping(): break
 
             if self.app.can_fire():
+                # Giữ chỗ trước khi trừ đạn để ProcessingWorker không kết thúc phiên khi phát cuối chưa kịp vào hàng đợi
+                self.app.shot_buffer.reserve()
                 self.app.decrement_bullet()
                 frame = self.app.camera.read()
                 if frame is not None:
@@ -86,11 +108,17 @@ class TriggerListener(threading.Thread):
                     shot_data = {
                         'frame': frame, 'timestamp': datetime.now(), 'shot_id': shot_id,
                         'burst_id': current_burst_id, 'shot_index': shot_in_burst_index,
-                        'zoom': zoom, 'center': center
+                        'zoom': zoom, 'center': center, 'session_id': self.app.get_session_id()
                     }
-                    self.app.processing_queue.put(shot_data)
+                    # put() không bao giờ chặn: khi hàng đợi đầy, ảnh được spill hoặc đánh dấu unscored
+                    result = self.app.shot_buffer.put(shot_data, reserved=True)
+                    if result == SHOT_SPILLED:
+                        logging.warning(f"Hàng đợi đầy, phát bắn {shot_id} được chuyển sang spill ra đĩa.")
+                    elif result == SHOT_UNSCORED:
+                        self.app.mark_shot_unscored(shot_data)
                     audio_player.play('shot')
                 else:
+                    self.app.shot_buffer.release()
                     logging.error("LỖI: Không thể đọc khung hình từ camera khi bắn.")
                 
                 shot_in_burst_index += 1
@@ -102,6 +130,7 @@ class TriggerListener(threading.Thread):
     def run(self):
         logging.info(f"Bắt đầu tìm kiếm cò bắn '{self.device_name}'...")
         while not self.app.is_stopping():
+            self.app.resources.checkpoint('trigger')
             try:
                 if self.device is None:
                     self.device = self.find_device()
@@ -115,6 +144,7 @@ class TriggerListener(threading.Thread):
                 
                 for event in self.device.read_loop():
                     if self.app.is_stopping(): break
+                    self.app.resources.checkpoint('trigger')
                     if event.type == evdev.ecodes.EV_KEY and event.code == self.key_code:
                         if event.value == 1 and not self.trigger_held: # Key press
                             self.trigger_held = True
@@ -139,50 +169,87 @@ class ProcessingWorker(threading.Thread):
         self.yolo_dataset_dir = "yolo_dataset"
         os.makedirs(self.base_captures_dir, exist_ok=True)
         os.makedirs(self.yolo_dataset_dir, exist_ok=True)
+        self.transformer = FrameTransformer(cache_size=config.TRANSFORM_CACHE_SIZE)
         logging.info("Luồng Xử lý Ảnh đã được khởi tạo.")
 
+    def process_shot(self, shot_data):
+        started_at = time.time()
+        queue_wait_ms = (started_at - shot_data["timestamp"].timestamp()) * 1000
+        rotated_frame = cv2.rotate(shot_data["frame"], cv2.ROTATE_90_CLOCKWISE)
+        
+        inference_started_at = time.time()
+        tasks_before = task_ids()
+        hit_target_name = analyze_shot(rotated_frame, shot_data["center"])
+        inference_ms = (time.time() - inference_started_at) * 1000
+        # Luồng mới sinh ra trong lúc predict là thread pool của torch: ghim chúng theo nhóm 'inference'
+        new_tasks = task_ids() - tasks_before
+        if new_tasks:
+            self.app.resources.adopt_threads('inference', new_tasks)
+        if hit_target_name:
+            self.app.register_hit(hit_target_name, shot_data['shot_id'], shot_data.get('session_id'))
+        
+        # Lưu ảnh và gửi review (logic gốc)
+        time_str = shot_data["timestamp"].strftime("%Y%m%d_%H%M%S_%f")
+        yolo_image_path = os.path.join(self.yolo_dataset_dir, f"{time_str}.jpg")
+        cv2.imwrite(yolo_image_path, rotated_frame)
+        
+        if shot_data["zoom"] <= 1.0:
+            # Không zoom: ảnh review chính là ảnh đã xoay ở trên (đã lưu xong), chỉ cần vẽ thêm tâm ngắm
+            final_image_for_review = draw_crosshair(rotated_frame, (shot_data["center"]['x'], shot_data["center"]['y']))
+        else:
+            # Có zoom: ảnh xoay nguyên khung vẫn cần cho YOLO/dataset, ảnh review được remap một lần từ khung hình gốc
+            final_image_for_review = self.transformer.render(shot_data["frame"], shot_data["zoom"], shot_data["center"])
+        _, buffer = cv2.imencode('.jpg', final_image_for_review)
+
+        # Lưu kết quả trước khi gửi ảnh, để phát bắn vẫn được ghi lại khi mất kết nối server
+        self.app.shot_store.record_shot(shot_data, 'scored', hit_target_name, queue_wait_ms, inference_ms,
+                                        (time.time() - started_at) * 1000)
+        shot_data['recorded'] = True
+
+        if self.app.sio.connected:
+            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+            self.app.sio.emit('new_shot_image', { 'shot_id': shot_data['shot_id'], 'image_data': f"data:image/jpeg;base64,{jpg_as_text}" })
+
+    def check_out_of_ammo(self):
+        # Chỉ kết thúc khi mọi phát đã bắn (kể cả phát bị spill ra đĩa) đều đã được chấm
+        is_active, _, ammo_left = self.app.get_session_state()
+        if is_active and ammo_left == 0 and self.app.shot_buffer.unfinished() == 0:
+            logging.info("Xử lý xong ảnh cuối và phát hiện hết đạn. Kết thúc phiên.")
+            self.app.end_session('Hết đạn')
+
     def run(self):
         logging.info("Luồng Xử lý Ảnh bắt đầu hoạt động.")
         while not self.app.is_stopping():
+            # Áp dụng số luồng torch/ghim CPU ngay trong luồng này (thread pool của torch kế thừa từ đây)
+            self.app.resources.checkpoint('inference')
             try:
-                shot_data = self.app.processing_queue.get(timeout=1)
-                
-                rotated_frame = cv2.rotate(shot_data["frame"], cv2.ROTATE_90_CLOCKWISE)
-                
-                hit_target_name = analyze_shot(rotated_frame, shot_data["center"])
-                if hit_target_name:
-                    self.app.register_hit(hit_target_name)
-                
-                # Lưu ảnh và gửi review (logic gốc)
-                time_str = shot_data["timestamp"].strftime("%Y%m%d_%H%M%S_%f")
-                yolo_image_path = os.path.join(self.yolo_dataset_dir, f"{time_str}.jpg")
-                cv2.imwrite(yolo_image_path, rotated_frame)
-                
-                final_image_for_review = draw_crosshair_on_frame(rotated_frame, shot_data["zoom"], shot_data["center"])
-                _, buffer = cv2.imencode('.jpg', final_image_for_review)
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-                self.app.sio.emit('new_shot_image', { 'shot_id': shot_data['shot_id'], 'image_data': f"data:image/jpeg;base64,{jpg_as_text}" })
-                
-                # Kiểm tra hết đạn sau khi xử lý
-                is_active, _, ammo_left = self.app.get_session_state()
-                if is_active and ammo_left == 0:
-                    logging.info("Xử lý xong ảnh cuối và phát hiện hết đạn. Kết thúc phiên.")
-                    self.app.end_session('Hết đạn')
-
-                self.app.processing_queue.task_done()
+                shot_data = self.app.shot_buffer.get(timeout=1)
             except queue.Empty:
+                # Phát cuối có thể bị đánh dấu unscored nên không đi qua hàng đợi
+                self.check_out_of_ammo()
                 continue
+
+            try:
+                self.process_shot(shot_data)
             except Exception as e:
                 logging.error(f"Lỗi trong ProcessingWorker: {e}", exc_info=True)
+                if not shot_data.get('recorded'):
+                    self.app.shot_store.record_shot(shot_data, 'error')
+            finally:
+                self.app.shot_buffer.task_done()
+
+            self.check_out_of_ammo()
 
 class StreamerWorker(threading.Thread):
     def __init__(self, app):
         super().__init__(daemon=True, name="StreamerWorker")
         self.app = app
+        self.transformer = FrameTransformer(cache_size=config.TRANSFORM_CACHE_SIZE)
 
     def run(self):
         logging.info("Luồng gửi video bắt đầu hoạt động.")
         while not self.app.is_stopping():
+            self.app.resources.checkpoint('streaming')
             if not self.app.camera.is_running():
                 time.sleep(1)
                 continue
@@ -190,9 +257,9 @@ class StreamerWorker(threading.Thread):
             original_frame = self.app.camera.read()
             if original_frame is None: continue
 
-            rotated_frame = cv2.rotate(original_frame, cv2.ROTATE_90_CLOCKWISE)
             zoom_level, center_point = self.app.get_current_state()
-            frame_to_send = draw_crosshair_on_frame(rotated_frame, zoom_level, center_point)
+            # Xoay + zoom + tâm ngắm trong một lần remap (bảng remap được cache theo mức zoom)
+            frame_to_send = self.transformer.render(original_frame, zoom_level, center_point)
             
             flag, encodedImage = cv2.imencode(".jpg", frame_to_send, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
             if not flag: continue
@@ -223,6 +290,11 @@ class CommandPoller(threading.Thread):
                             self.app.start_session()
                         elif command_type == 'reset':
                             self.app.reset_session()
+                        elif command_type == 'resources':
+                            try:
+                                self.app.resources.update(command.get('value') or {})
+                            except Exception as e:
+                                logging.error(f"Lỗi khi áp dụng lệnh tài nguyên: {e}", exc_info=True)
                         else:
                             self.app.set_state_from_command(command)
             except requests.exceptions.RequestException: